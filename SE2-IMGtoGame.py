@@ -1,3 +1,12 @@
+import argparse
+import hashlib
+import json
+import io
+import os
+import re
+import shutil
+import zlib
+from pathlib import Path
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
 from PIL import Image, ImageTk, ImageDraw
@@ -114,44 +123,20 @@ def compute_shape_mask(image, shape_thresh=250):
     mask = arr < shape_thresh
     return mask
 
-def generate_blocks_with_allowed(image_pil, scale, allowed_types, threshold=30.0, debug=False):
-    """
-    Gera blocos usando somente os tipos permitidos (allowed_types).
-    Cada tipo é mapeado para um tamanho: "25cm" → 1 célula, "50cm" → 2 células, "2.5m" → 10 células.
-    Tenta mesclar células para os tipos permitidos (maior primeiro).
-    Preenche as células restantes com o tipo fallback, SE HOUVER ALGO PERMITIDO.
-    Se allowed_types estiver vazio, retorna uma lista vazia.
-    Retorna: blocks, small_px, new_width, new_height, num_rows, num_cols, inside.
-    """
-    size_mapping = {"25cm": 1, "50cm": 2, "2.5m": 10}
-    if not allowed_types:
-        if debug:
-            print("Nenhum tipo de bloco permitido. Retornando lista vazia.")
-        # Retorna a matriz 'inside' mesmo que não haja blocos
-        width, height = image_pil.size
-        small_px = int(round(0.25 / scale))
-        if small_px <= 0:
-            small_px = 1
-        num_cols = width // small_px
-        num_rows = height // small_px
-        new_width = num_cols * small_px
-        new_height = num_rows * small_px
-        image_resized = image_pil.resize((new_width, new_height))
-        mask = compute_shape_mask(image_resized, shape_thresh=250)
-        inside = np.zeros((num_rows, num_cols), dtype=bool)
-        for r in range(num_rows):
-            for c in range(num_cols):
-                cell_mask = mask[r*small_px:(r+1)*small_px, c*small_px:(c+1)*small_px]
-                inside[r, c] = (cell_mask.mean() > 0.5)
-        return [], small_px, new_width, new_height, num_rows, num_cols, inside
-
-    allowed_order = sorted(allowed_types, key=lambda t: size_mapping[t], reverse=True)
-    # Define fallback: o menor dos tipos permitidos
-    fallback = min(allowed_types, key=lambda t: size_mapping[t])
-    
+def cell_size_px(scale):
+    """Retorna o tamanho (em pixels) da menor célula (25 cm) para a escala informada."""
     small_px = int(round(0.25 / scale))
     if small_px <= 0:
         small_px = 1
+    return small_px
+
+def compute_cell_grids(image_pil, small_px, shape_thresh=250):
+    """
+    Redimensiona a imagem para um múltiplo de small_px e reduz para o nível de células.
+    Retorna: new_width, new_height, num_rows, num_cols, inside, cell_colors.
+    inside é uma matriz booleana (num_rows, num_cols) e cell_colors uma matriz
+    float32 (num_rows, num_cols, 3) com a cor média de cada célula.
+    """
     width, height = image_pil.size
     num_cols = width // small_px
     num_rows = height // small_px
@@ -159,7 +144,7 @@ def generate_blocks_with_allowed(image_pil, scale, allowed_types, threshold=30.0
     new_height = num_rows * small_px
 
     image_resized = image_pil.resize((new_width, new_height))
-    mask = compute_shape_mask(image_resized, shape_thresh=250)
+    mask = compute_shape_mask(image_resized, shape_thresh=shape_thresh)
     inside = np.zeros((num_rows, num_cols), dtype=bool)
     for r in range(num_rows):
         for c in range(num_cols):
@@ -171,6 +156,34 @@ def generate_blocks_with_allowed(image_pil, scale, allowed_types, threshold=30.0
         for c in range(num_cols):
             cell = img_np[r*small_px:(r+1)*small_px, c*small_px:(c+1)*small_px, :]
             cell_colors[r, c] = cell.mean(axis=(0,1))
+    return new_width, new_height, num_rows, num_cols, inside, cell_colors
+
+def generate_blocks_with_allowed(image_pil, scale, allowed_types, threshold=30.0, debug=False, grids=None):
+    """
+    Gera blocos usando somente os tipos permitidos (allowed_types).
+    Cada tipo é mapeado para um tamanho: "25cm" → 1 célula, "50cm" → 2 células, "2.5m" → 10 células.
+    Tenta mesclar células para os tipos permitidos (maior primeiro).
+    Preenche as células restantes com o tipo fallback, SE HOUVER ALGO PERMITIDO.
+    Se allowed_types estiver vazio, retorna uma lista vazia.
+    grids: resultado de compute_cell_grids (por exemplo, vindo do cache em disco);
+    quando informado, image_pil não é redimensionada nem lida novamente.
+    Retorna: blocks, small_px, new_width, new_height, num_rows, num_cols, inside.
+    """
+    size_mapping = {"25cm": 1, "50cm": 2, "2.5m": 10}
+    small_px = cell_size_px(scale)
+    if grids is None:
+        grids = compute_cell_grids(image_pil, small_px)
+    new_width, new_height, num_rows, num_cols, inside, cell_colors = grids
+    if not allowed_types:
+        if debug:
+            print("Nenhum tipo de bloco permitido. Retornando lista vazia.")
+        # Retorna a matriz 'inside' mesmo que não haja blocos
+        return [], small_px, new_width, new_height, num_rows, num_cols, inside
+
+    allowed_order = sorted(allowed_types, key=lambda t: size_mapping[t], reverse=True)
+    # Define fallback: o menor dos tipos permitidos
+    fallback = min(allowed_types, key=lambda t: size_mapping[t])
+    
     merged = np.zeros((num_rows, num_cols), dtype=bool)
     blocks = []
     
@@ -205,7 +218,7 @@ def generate_blocks_with_allowed(image_pil, scale, allowed_types, threshold=30.0
                     "row_start": r,
                     "col_start": c,
                     "cell_size": bs,
-                    "avg_color": cell_colors[r, c],
+                    "avg_color": np.array(cell_colors[r, c]),
                     "block_type": fallback
                 })
     if debug:
@@ -265,6 +278,227 @@ def generate_schematic_image_from_blocks(image_size, blocks, small_px):
         draw.rectangle([x0, y0, x1, y1], outline="black", width=1)
     return schematic
 
+# ===================== Cache em Disco =====================
+CACHE_VERSION = 1
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+CACHE_DIR = Path(os.environ.get("SE2_CACHE_DIR") or Path.home() / ".cache" / "se2-imgtogame")
+
+def file_content_hash(data):
+    """Retorna o SHA-256 (hex) dos bytes informados."""
+    return hashlib.sha256(data).hexdigest()
+
+def _file_crc32(path):
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+class GridCache:
+    """
+    Cache em disco das matrizes por célula (inside e cell_colors).
+    As entradas ficam no subdiretório "grids" de cache_dir; cada uma é um
+    diretório com arquivos .npy (abertos via memory-map) e um meta.json com
+    dimensões e CRC32 de cada arquivo, identificada pelo hash do conteúdo da
+    imagem, small_px e o limiar da máscara.
+    Somente diretórios com o formato de chave do cache são listados, removidos
+    ou substituídos; qualquer outro conteúdo é ignorado.
+    """
+    ARRAYS = ("inside", "cell_colors")
+    SUBDIR = "grids"
+    KEY_RE = re.compile(rf"^v{CACHE_VERSION}-[0-9a-f]{{64}}-\d+-\d+$")
+    TMP_RE = re.compile(rf"^\.tmp-v{CACHE_VERSION}-[0-9a-f]{{64}}-\d+-\d+-\d+$")
+
+    def __init__(self, cache_dir=None, max_bytes=CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir) if cache_dir else CACHE_DIR
+        self.entries_dir = self.cache_dir / self.SUBDIR
+        self.max_bytes = max_bytes
+
+    def key(self, content_hash, small_px, shape_thresh=250):
+        """Retorna a chave da entrada, ou None se os parâmetros não formarem uma chave válida."""
+        key = f"v{CACHE_VERSION}-{content_hash}-{small_px}-{shape_thresh}"
+        return key if self.KEY_RE.match(key) else None
+
+    def _entries(self, include_tmp=False):
+        if not self.entries_dir.is_dir():
+            return []
+        return [p for p in self.entries_dir.iterdir()
+                if p.is_dir() and not p.is_symlink()
+                and (self.KEY_RE.match(p.name) or (include_tmp and self.TMP_RE.match(p.name)))]
+
+    @staticmethod
+    def _entry_size(entry):
+        return sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+
+    def _discard(self, entry):
+        """Remove a entrada (se for do cache) e retorna True se ela não existir mais."""
+        if entry.parent == self.entries_dir and (self.KEY_RE.match(entry.name) or self.TMP_RE.match(entry.name)):
+            shutil.rmtree(entry, ignore_errors=True)
+        return not entry.exists()
+
+    def _read_entry(self, entry):
+        """
+        Abre as matrizes da entrada via memory-map após validar meta.json,
+        formato, dtype, tamanho e CRC32 de cada arquivo.
+        """
+        with open(entry / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        small_px = meta["small_px"]
+        if self.key(meta["content_hash"], small_px, meta["shape_thresh"]) != entry.name:
+            raise ValueError("meta.json não corresponde à chave")
+        num_rows, num_cols = meta["num_rows"], meta["num_cols"]
+        if (meta["new_width"] != num_cols * small_px or meta["new_height"] != num_rows * small_px
+                or num_rows < 0 or num_cols < 0):
+            raise ValueError("Dimensões inconsistentes em meta.json")
+        expected = {"inside": ((num_rows, num_cols), np.bool_),
+                    "cell_colors": ((num_rows, num_cols, 3), np.float32)}
+        arrays = {}
+        for name in self.ARRAYS:
+            path = entry / f"{name}.npy"
+            arr = np.load(path, mmap_mode="r", allow_pickle=False)
+            shape, dtype = expected[name]
+            if arr.shape != shape or arr.dtype != dtype:
+                raise ValueError(f"Formato inesperado em {path.name}")
+            if arr.offset + arr.nbytes != path.stat().st_size:
+                raise ValueError(f"Tamanho inesperado em {path.name}")
+            if _file_crc32(path) != meta["crc32"][name]:
+                raise ValueError(f"CRC32 divergente em {path.name}")
+            arrays[name] = arr
+        return meta, arrays
+
+    def load(self, content_hash, small_px, shape_thresh=250, debug=False):
+        """
+        Retorna as grades no formato de compute_cell_grids, com as matrizes
+        abertas em modo somente leitura via memory-map, ou None se não houver
+        entrada válida.
+        """
+        key = self.key(content_hash, small_px, shape_thresh)
+        if key is None:
+            return None
+        entry = self.entries_dir / key
+        meta_path = entry / "meta.json"
+        if not meta_path.is_file():
+            return None
+        try:
+            meta, arrays = self._read_entry(entry)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if debug:
+                print(f"Entrada de cache inválida descartada ({key}): {e}")
+            self._discard(entry)
+            return None
+        # Atualiza o horário de acesso usado na remoção por LRU
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+        return (meta["new_width"], meta["new_height"], meta["num_rows"], meta["num_cols"],
+                arrays["inside"], arrays["cell_colors"])
+
+    def store(self, content_hash, small_px, grids, shape_thresh=250, debug=False):
+        """Grava as grades de compute_cell_grids e aplica o limite de tamanho."""
+        key = self.key(content_hash, small_px, shape_thresh)
+        if key is None:
+            return
+        new_width, new_height, num_rows, num_cols, inside, cell_colors = grids
+        entry = self.entries_dir / key
+        tmp = self.entries_dir / f".tmp-{key}-{os.getpid()}"
+        try:
+            self.entries_dir.mkdir(parents=True, exist_ok=True)
+            self._discard(tmp)
+            tmp.mkdir()
+            crcs = {}
+            for name, arr in (("inside", np.asarray(inside, dtype=bool)),
+                              ("cell_colors", np.asarray(cell_colors, dtype=np.float32))):
+                path = tmp / f"{name}.npy"
+                np.save(path, arr, allow_pickle=False)
+                crcs[name] = _file_crc32(path)
+            meta = {
+                "version": CACHE_VERSION,
+                "content_hash": content_hash,
+                "small_px": small_px,
+                "shape_thresh": shape_thresh,
+                "new_width": new_width,
+                "new_height": new_height,
+                "num_rows": num_rows,
+                "num_cols": num_cols,
+                "crc32": crcs,
+            }
+            with open(tmp / "meta.json", "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            self._discard(entry)
+            os.replace(tmp, entry)
+        except OSError as e:
+            if debug:
+                print(f"Falha ao gravar no cache ({key}): {e}")
+            self._discard(tmp)
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove as entradas menos usadas até o total caber em max_bytes."""
+        entries = []
+        for entry in self._entries():
+            try:
+                entries.append(((entry / "meta.json").stat().st_mtime, self._entry_size(entry), entry))
+            except OSError:
+                # Entrada incompleta ou sem meta.json
+                self._discard(entry)
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_bytes:
+                break
+            # Arquivos ainda mapeados (ex.: no Windows) podem impedir a remoção.
+            if self._discard(entry):
+                total -= size
+                removed += 1
+        return removed
+
+    def verify(self, prune=False):
+        """
+        Retorna os nomes das entradas corrompidas. Com prune=True elas são
+        removidas, e apenas as efetivamente removidas são retornadas.
+        """
+        corrupted = []
+        for entry in self._entries():
+            try:
+                self._read_entry(entry)
+            except (OSError, ValueError, KeyError, TypeError):
+                if not prune or self._discard(entry):
+                    corrupted.append(entry.name)
+        return corrupted
+
+    def info(self):
+        """Retorna um resumo do cache: diretório, número de entradas e tamanho total."""
+        entries = self._entries()
+        return {
+            "cache_dir": str(self.entries_dir),
+            "entries": len(entries),
+            "total_bytes": sum(self._entry_size(e) for e in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+    def clear(self):
+        """Remove todas as entradas reconhecidas do cache e retorna quantas foram removidas."""
+        return sum(1 for entry in self._entries(include_tmp=True) if self._discard(entry))
+
+def load_cell_grids(image_pil, image_hash, small_px, cache, debug=False):
+    """
+    Retorna as grades de compute_cell_grids, lidas do cache quando houver
+    entrada válida; caso contrário, decodifica image_pil e grava no cache.
+    Sem image_hash o cache não é usado. Erros de decodificação são propagados.
+    """
+    use_cache = image_hash is not None
+    grids = cache.load(image_hash, small_px, debug=debug) if use_cache else None
+    if grids is not None:
+        if debug:
+            print(f"Grades carregadas do cache ({cache.entries_dir})")
+        return grids
+    grids = compute_cell_grids(image_pil.convert("RGB"), small_px)
+    if use_cache:
+        cache.store(image_hash, small_px, grids, debug=debug)
+    return grids
+
 # ===================== Visualizador com Zoom =====================
 class ZoomWindow(tk.Toplevel):
     def __init__(self, parent, image):
@@ -357,7 +591,7 @@ class ZoomWindow(tk.Toplevel):
 
 # ===================== Interface Gráfica Principal =====================
 class PixelArtSchematicApp(ttk.Frame):
-    def __init__(self, master):
+    def __init__(self, master, cache_dir=None):
         super().__init__(master)
         self.master = master
         self.debug_var = tk.BooleanVar(value=False)
@@ -367,6 +601,8 @@ class PixelArtSchematicApp(ttk.Frame):
         self.master.title(self.strings["title"])
         self.master.geometry("1100x750")
         self.image_pil = None
+        self.image_hash = None
+        self.grid_cache = GridCache(cache_dir)
         self.blocks = []
         self.instructions = []
         self.schematic = None
@@ -505,7 +741,12 @@ class PixelArtSchematicApp(ttk.Frame):
         )
         if file_path:
             try:
-                self.image_pil = Image.open(file_path).convert("RGB")
+                # Hash e imagem vêm dos mesmos bytes; a decodificação é adiada até
+                # process_image e, com o cache quente, nem chega a ocorrer.
+                with open(file_path, "rb") as f:
+                    data = f.read()
+                image_pil = Image.open(io.BytesIO(data))
+                self.image_pil, self.image_hash = image_pil, file_content_hash(data)
                 messagebox.showinfo(self.strings["load_image"], f"{self.strings['load_success']} {file_path}")
             except Exception as e:
                 messagebox.showerror(self.strings["error"], f"Erro ao carregar a imagem:\n{e}")
@@ -547,9 +788,18 @@ class PixelArtSchematicApp(ttk.Frame):
             allowed.append("2.5m")
         # Se nenhum tipo for permitido, NÃO usamos fallback – retornamos blocos vazios.
         
+        # Usa as grades por célula do cache em disco quando disponíveis.
+        small_px = cell_size_px(scale)
+        try:
+            grids = load_cell_grids(self.image_pil, self.image_hash, small_px, self.grid_cache,
+                                    debug=self.debug_var.get())
+        except Exception as e:
+            messagebox.showerror(self.strings["error"], f"Erro ao carregar a imagem:\n{e}")
+            return
+        
         # Gera os blocos usando somente os tipos permitidos.
         self.blocks, small_px, new_width, new_height, num_rows, num_cols, inside = generate_blocks_with_allowed(
-            self.image_pil, scale, allowed, threshold=30.0, debug=self.debug_var.get())
+            None, scale, allowed, threshold=30.0, debug=self.debug_var.get(), grids=grids)
         if not self.blocks:
             messagebox.showinfo(self.strings["warning"], "Nenhum bloco gerado (possivelmente nenhum tipo permitido).")
             return
@@ -632,9 +882,33 @@ class PixelArtSchematicApp(ttk.Frame):
         ZoomWindow(self, self.schematic)
 
 # ===================== Execução Principal =====================
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=LANG_STRINGS["en"]["title"])
+    parser.add_argument("--cache-dir", help="Cache directory (default: $SE2_CACHE_DIR or ~/.cache/se2-imgtogame)")
+    parser.add_argument("--cache-info", action="store_true",
+                        help="Show cache usage and corrupted entries (read-only) and exit")
+    parser.add_argument("--cache-verify", action="store_true",
+                        help="Remove corrupted cache entries and exit")
+    parser.add_argument("--cache-clear", action="store_true", help="Remove all cache entries and exit")
+    args = parser.parse_args(argv)
+    if args.cache_info or args.cache_clear or args.cache_verify:
+        cache = GridCache(args.cache_dir)
+        if args.cache_clear:
+            print(f"Removed {cache.clear()} cache entries from {cache.entries_dir}")
+        if args.cache_verify:
+            print(f"Removed {len(cache.verify(prune=True))} corrupted cache entries from {cache.entries_dir}")
+        if args.cache_info:
+            corrupted = cache.verify()
+            info = cache.info()
+            print(f"Cache dir:  {info['cache_dir']}")
+            print(f"Entries:    {info['entries']} ({len(corrupted)} corrupted)")
+            print(f"Size:       {info['total_bytes'] / (1024 * 1024):.1f} MiB "
+                  f"(limit {info['max_bytes'] / (1024 * 1024):.0f} MiB)")
+            for name in corrupted:
+                print(f"Corrupted:  {name}")
+        return
     root = tk.Tk()
-    app = PixelArtSchematicApp(root)
+    app = PixelArtSchematicApp(root, cache_dir=args.cache_dir)
     app.pack(expand=True, fill="both")
     root.mainloop()
 
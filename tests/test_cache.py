@@ -0,0 +1,186 @@
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+MODULE_PATH = Path(__file__).resolve().parents[1] / "SE2-IMGtoGame.py"
+SPEC = importlib.util.spec_from_file_location("se2_imgtogame", MODULE_PATH)
+MOD = importlib.util.module_from_spec(SPEC)
+SPEC.loader.exec_module(MOD)
+
+IMG_PATH = Path(__file__).resolve().parents[1] / "Screenshots" / "test.jpg"
+HASH_A, HASH_B, HASH_C = ("a" * 64, "b" * 64, "c" * 64)
+
+
+def _grids(small_px=5):
+    img = Image.open(IMG_PATH).convert("RGB")
+    return MOD.compute_cell_grids(img, small_px)
+
+
+def test_cache_roundtrip_is_memory_mapped_and_matches(tmp_path):
+    cache = MOD.GridCache(tmp_path)
+    content_hash = MOD.file_content_hash(IMG_PATH.read_bytes())
+    grids = _grids()
+    assert cache.load(content_hash, 5) is None
+    cache.store(content_hash, 5, grids)
+
+    cached = cache.load(content_hash, 5)
+    assert cached[:4] == grids[:4]
+    assert isinstance(cached[4], np.memmap)
+    assert np.array_equal(cached[4], grids[4])
+    assert np.array_equal(cached[5], grids[5])
+    assert cache.load(content_hash, 6) is None
+
+    allowed = ["25cm", "50cm", "2.5m"]
+    blocks = MOD.generate_blocks_with_allowed(None, 0.05, allowed, grids=cached)[0]
+    assert len(blocks) == 2430
+
+
+def test_cache_ignores_invalid_hash(tmp_path):
+    cache = MOD.GridCache(tmp_path)
+    cache.store(None, 5, _grids(small_px=50))
+    assert cache.load(None, 5) is None
+    assert cache.info()["entries"] == 0
+
+
+def test_cache_discards_truncated_entry(tmp_path):
+    cache = MOD.GridCache(tmp_path)
+    cache.store(HASH_A, 5, _grids())
+    entry = cache.entries_dir / cache.key(HASH_A, 5)
+    data = (entry / "cell_colors.npy").read_bytes()
+    (entry / "cell_colors.npy").write_bytes(data[:-16])
+
+    assert cache.load(HASH_A, 5) is None
+    assert not entry.exists()
+
+
+def _flip_last_byte(path):
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xFF
+    path.write_bytes(bytes(data))
+
+
+def test_cache_load_discards_bit_flip(tmp_path):
+    cache = MOD.GridCache(tmp_path)
+    cache.store(HASH_A, 50, _grids(small_px=50))
+    entry = cache.entries_dir / cache.key(HASH_A, 50)
+    _flip_last_byte(entry / "cell_colors.npy")
+
+    assert cache.load(HASH_A, 50) is None
+    assert not entry.exists()
+
+
+def test_cache_load_rejects_inconsistent_meta(tmp_path):
+    cache = MOD.GridCache(tmp_path)
+    cache.store(HASH_A, 50, _grids(small_px=50))
+    meta_path = cache.entries_dir / cache.key(HASH_A, 50) / "meta.json"
+    meta = MOD.json.loads(meta_path.read_text())
+    meta["new_width"] += 1
+    meta_path.write_text(MOD.json.dumps(meta))
+
+    assert cache.load(HASH_A, 50) is None
+
+
+def test_cache_verify_reports_without_removing_unless_pruning(tmp_path):
+    cache = MOD.GridCache(tmp_path)
+    cache.store(HASH_A, 50, _grids(small_px=50))
+    cache.store(HASH_B, 50, _grids(small_px=50))
+    _flip_last_byte(cache.entries_dir / cache.key(HASH_A, 50) / "cell_colors.npy")
+
+    assert cache.verify() == [cache.key(HASH_A, 50)]
+    assert cache.info()["entries"] == 2
+    assert cache.verify(prune=True) == [cache.key(HASH_A, 50)]
+    assert cache.info()["entries"] == 1
+    assert cache.load(HASH_B, 50) is not None
+
+
+def test_warm_grids_match_cold_grids_from_lazy_image(tmp_path):
+    data = IMG_PATH.read_bytes()
+    content_hash = MOD.file_content_hash(data)
+    cache = MOD.GridCache(tmp_path)
+    allowed = ["25cm", "50cm", "2.5m"]
+
+    cold = MOD.load_cell_grids(Image.open(MOD.io.BytesIO(data)), content_hash, 5, cache)
+    assert not isinstance(cold[4], np.memmap)
+    warm = MOD.load_cell_grids(None, content_hash, 5, cache)
+    assert isinstance(warm[4], np.memmap)
+
+    cold_blocks = MOD.generate_blocks_with_allowed(None, 0.05, allowed, grids=cold)[0]
+    warm_blocks = MOD.generate_blocks_with_allowed(None, 0.05, allowed, grids=warm)[0]
+    assert len(warm_blocks) == len(cold_blocks) == 2430
+    for a, b in zip(cold_blocks, warm_blocks):
+        assert a["block_type"] == b["block_type"]
+        assert (a["row_start"], a["col_start"], a["cell_size"]) == (b["row_start"], b["col_start"], b["cell_size"])
+        assert np.array_equal(a["avg_color"], b["avg_color"])
+        assert not isinstance(b["avg_color"], np.memmap)
+
+
+def test_cli_cache_info_verify_and_clear(tmp_path, capsys):
+    cache = MOD.GridCache(tmp_path)
+    cache.store(HASH_A, 50, _grids(small_px=50))
+    cache.store(HASH_B, 50, _grids(small_px=50))
+    _flip_last_byte(cache.entries_dir / cache.key(HASH_A, 50) / "cell_colors.npy")
+    (tmp_path / "photos").mkdir()
+
+    MOD.main(["--cache-dir", str(tmp_path), "--cache-info"])
+    out = capsys.readouterr().out
+    assert "Entries:    2 (1 corrupted)" in out
+    assert f"Corrupted:  {cache.key(HASH_A, 50)}" in out
+    assert cache.info()["entries"] == 2
+
+    MOD.main(["--cache-dir", str(tmp_path), "--cache-verify"])
+    assert "Removed 1 corrupted cache entries" in capsys.readouterr().out
+    assert cache.info()["entries"] == 1
+
+    MOD.main(["--cache-dir", str(tmp_path), "--cache-clear"])
+    assert "Removed 1 cache entries" in capsys.readouterr().out
+    assert cache.info()["entries"] == 0
+    assert (tmp_path / "photos").is_dir()
+
+
+def test_cache_never_touches_unrelated_directories(tmp_path):
+    (tmp_path / "photos").mkdir()
+    (tmp_path / "photos" / "keep.txt").write_text("x")
+    (tmp_path / ".config").mkdir()
+    (tmp_path / "grids").mkdir()
+    (tmp_path / "grids" / "notes").mkdir()
+    cache = MOD.GridCache(tmp_path, max_bytes=0)
+    cache.store(HASH_A, 50, _grids(small_px=50))
+    cache.evict()
+    cache.clear()
+
+    assert (tmp_path / "photos" / "keep.txt").exists()
+    assert (tmp_path / ".config").is_dir()
+    assert (tmp_path / "grids" / "notes").is_dir()
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    grids = _grids(small_px=50)
+    cache = MOD.GridCache(tmp_path)
+    cache.store(HASH_A, 50, grids)
+    entry_size = cache.info()["total_bytes"]
+    cache.max_bytes = entry_size * 2
+    cache.store(HASH_B, 50, grids)
+    MOD.os.utime(cache.entries_dir / cache.key(HASH_A, 50) / "meta.json", (1, 1))
+    MOD.os.utime(cache.entries_dir / cache.key(HASH_B, 50) / "meta.json", (2, 2))
+    cache.load(HASH_A, 50)
+    cache.store(HASH_C, 50, grids)
+
+    assert cache.load(HASH_B, 50) is None
+    assert cache.load(HASH_A, 50) is not None
+    assert cache.load(HASH_C, 50) is not None
+    assert cache.info()["entries"] == 2
+    assert cache.clear() == 2
+    assert cache.info()["entries"] == 0
+
+
+def test_cache_counts_only_entries_actually_removed(tmp_path, monkeypatch):
+    cache = MOD.GridCache(tmp_path)
+    cache.store(HASH_A, 50, _grids(small_px=50))
+    monkeypatch.setattr(MOD.shutil, "rmtree", lambda *args, **kwargs: None)
+    cache.max_bytes = 0
+
+    assert cache.evict() == 0
+    assert cache.clear() == 0
+    assert cache.info()["entries"] == 1